@@ -0,0 +1,72 @@
+"""
+Micro-benchmark of resolving a throw: the original (three-move, string-comparison) implementation vs. the variant engine.
+
+Usage: python scripts/bench_variants.py [<iterations>]
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'serverless_rps'))
+import variants
+
+
+# The original implementation (utils.getRockPaperScissorsPlayFromLeftSubstring() and utils.isPlayerWinner()), as the baseline
+
+def getRockPaperScissorsPlayFromLeftSubstring(play):
+    if "rock".startswith(play.lower()):
+        return 'rock'
+    elif "paper".startswith(play.lower()):
+        return 'paper'
+    elif "scissors".startswith(play.lower()):
+        return 'scissors'
+    else:
+        return None
+
+
+def isPlayerWinner(play, other_player_play):
+    play_str = getRockPaperScissorsPlayFromLeftSubstring(play)
+    other_player_play_str = getRockPaperScissorsPlayFromLeftSubstring(other_player_play)
+
+    if play_str is None:
+        raise ValueError("Bad 'play': not one of rock, paper, or scissors.")
+    if other_player_play_str is None:
+        raise ValueError("Bad 'other_player_play': not one of rock, paper, or scissors.")
+
+    psr = ['paper', 'scissors', 'rock']
+    play_int = psr.index(play_str)
+    other_play_int = psr.index(other_player_play_str)
+
+    if play_int == other_play_int:
+        return None
+    elif other_play_int == ((play_int + 1) % 3 ):
+        return False
+    else:
+        return True
+
+
+def resolveThrow(variant, play, other_player_play):
+    """ The engine's equivalent of isPlayerWinner(): resolve the (abbreviated) play, and the other player's stored play """
+    return variant.isPlayerWinner(variant.resolvePlay(play), variant.resolvePlay(other_player_play))
+
+
+def main(argv):
+    iterations = int(argv[1]) if len(argv) > 1 else 300000
+
+    rps = variants.getVariant('rps')
+    rps15 = variants.getVariant('rps15')
+
+    cases = [
+        ("original, rps ('s' vs 'paper')", lambda: isPlayerWinner('s', 'paper')),
+        ("engine, rps ('s' vs 'paper')", lambda: resolveThrow(rps, 's', 'paper')),
+        ("engine, rps15 ('lig' vs 'gun')", lambda: resolveThrow(rps15, 'lig', 'gun')),
+    ]
+
+    for name, case in cases:
+        # Best of 5, to reduce noise from other processes
+        best = min(timeit.repeat(case, number=iterations, repeat=5))
+        print("{:<32} {:>8.0f} ns/throw".format(name, best / iterations * 1e9))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,29 @@
+"""
+Bulk export of the GameHistory Table, as JSON lines (one decoded game per line) on stdout.
+
+Usage: python scripts/export_game_history.py <gamehistory_table_name> [<E.164 phone number>]
+
+Exports every player's history, or only the given player's. Uses the default AWS credentials/region (as for the AWS CLI).
+"""
+import json
+import os
+import sys
+import boto3
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'serverless_rps'))
+import utils
+
+
+def main(argv):
+    if len(argv) not in (2, 3):
+        sys.exit(__doc__.strip())
+
+    history_table = boto3.resource('dynamodb').Table(argv[1])
+    user_number = argv[2] if len(argv) == 3 else None
+
+    for game in utils.exportGameHistory(history_table, user_number):
+        print(json.dumps(game))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,76 @@
+"""
+One-time migration of pending games from the GameState Table's (legacy) 'games' attribute to the PendingGame Table.
+
+Usage: python scripts/migrate_pending_games.py <gamestate_table_name> <nickname_table_name> <pendinggame_table_name>
+
+Run once, after deploying the PendingGame Table. Each player's 'games' dict (their throws, keyed by the other player's
+nickname) is copied into the PendingGame Table, then removed from their GameState record. Throws against nicknames that
+are no longer registered are dropped, and throws already in the PendingGame Table are kept. Safe to re-run.
+Uses the default AWS credentials/region (as for the AWS CLI).
+"""
+import os
+import sys
+import boto3
+from botocore.exceptions import ClientError
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'serverless_rps'))
+import utils
+
+
+def main(argv):
+    if len(argv) != 4:
+        sys.exit(__doc__.strip())
+
+    dynamodb = boto3.resource('dynamodb')
+    gamestate_table = dynamodb.Table(argv[1])
+    nickname_table = dynamodb.Table(argv[2])
+    pending_table = dynamodb.Table(argv[3])
+
+    scan_args = {
+        'FilterExpression': "attribute_exists(games)",
+        'ProjectionExpression': 'phone_number, games'
+    }
+
+    migrated_users = 0
+    migrated_games = 0
+    dropped_games = 0
+
+    while True:
+        resp = gamestate_table.scan(**scan_args)
+
+        for gamestate in resp['Items']:
+            user_number = gamestate['phone_number']
+
+            for opponent_nickname, play in gamestate['games'].items():
+                nick_record = utils.getNicknameRecord(nickname_table, opponent_nickname)
+                if nick_record is None:
+                    print("Dropping {}'s throw against unregistered nickname '{}'".format(user_number, opponent_nickname))
+                    dropped_games += 1
+                    continue
+
+                if utils.putPendingGame(pending_table, user_number, opponent_nickname, nick_record['phone_number'], play, overwrite=False) is not None:
+                    migrated_games += 1
+
+            # Conditional, so a player who quit during the migration isn't re-created
+            try:
+                gamestate_table.update_item(
+                    Key={'phone_number': user_number},
+                    UpdateExpression="remove games",
+                    ConditionExpression="attribute_exists(phone_number)"
+                )
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':  # ConditionalCheckFailedException => User Quit
+                    raise e
+
+            migrated_users += 1
+
+        if 'LastEvaluatedKey' not in resp:
+            break
+
+        scan_args['ExclusiveStartKey'] = resp['LastEvaluatedKey']
+
+    print("Migrated {} pending games ({} dropped) of {} players".format(migrated_games, dropped_games, migrated_users))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -2,6 +2,7 @@ import json
 import os
 import boto3
 import logging
+import time
 import commands, utils
 
 
@@ -16,6 +17,8 @@ def lambda_handler(event, context):
     dynamodb_idempotencytable = os.environ['DYNAMODB_IDEMPOTENCYTABLE']
     dynamodb_gamestatetable = os.environ['DYNAMODB_GAMESTATETABLE']
     dynamodb_nicknametable = os.environ['DYNAMODB_NICKNAMETABLE']
+    dynamodb_pendinggametable = os.environ['DYNAMODB_PENDINGGAMETABLE']
+    dynamodb_gamehistorytable = os.environ['DYNAMODB_GAMEHISTORYTABLE']
     sqs_incomingmessagequeue = os.environ['SQS_INCOMINGMESSAGEQUEUE']
 
     dynamodb = boto3.resource('dynamodb')
@@ -26,77 +29,119 @@ def lambda_handler(event, context):
     idempotency_table = dynamodb.Table(dynamodb_idempotencytable)
     gamestate_table = dynamodb.Table(dynamodb_gamestatetable)
     nickname_table = dynamodb.Table(dynamodb_nicknametable)
+    pending_table = dynamodb.Table(dynamodb_pendinggametable)
+    history_table = dynamodb.Table(dynamodb_gamehistorytable)
 
     idempotency_skips = 0 # Number of records not processed due to messageId being in Idempotency Table
     failed_messages = 0 # Number of messages which failed to process. If ultimately nonzero, an exception will be raised.
-    for record in event['Records']:
-
-        messageId = record['messageId']
-
-        # We scope these above the try, as we'll need them in the finally for lock-clearing
-        lock_uuid = None
-        user_number = None
-        try:
-            # insertIdempotencyRecord() returns False if it failed to insert a record, because of an existing (and not expired) record
-            # (In the event of another failure, it raises an Exception)
-            if not utils.insertIdempotencyRecord(idempotency_table, messageId):
-                idempotency_skips += 1
-                continue
-
-            # NOTE: Behavior here seems inconsistent. Examples suggest event record body is a dict, but in-practice it seems to be string.
-            record_body = record['body']
-            if isinstance(record['body'], str):
-                record_body = json.loads(record_body)
-
-            message = record_body['Message']
-            message = json.loads(message)
-
-            message_content = message['messageBody']
-            user_number = message['originationNumber']
-            outgoing_number = message['destinationNumber']
-
-            lock_uuid = utils.lockUsersGameState(gamestate_table, user_number)
-            if lock_uuid is None:
-                err = "Failed to lock '{}'".format(user_number)
-                logging.error(err)
-                raise RuntimeError(err)
-            else:
-                logging.info("Successfully acquired lock '{}' on requestor ('{}')".format(lock_uuid, user_number))
-
-            result = routeRequest(gamestate_table, nickname_table, user_number, message_content)
-            utils.sendResultToRequestor_SMS(user_number, result.message, pinpoint_client, pinpoint_appid, outgoing_number)
-
-            if result.other_user_number is not None and result.other_user_message is not None:
-                utils.sendResultToRequestor_SMS(result.other_user_number, result.other_user_message, pinpoint_client, pinpoint_appid, outgoing_number)
-
-        except Exception as e:
-            logging.error("Failed to process messageId '{}'".format(messageId), exc_info=True)
-            failed_messages += 1
-            # Remove the idempotency record, so another execution may (re)try without waiting out the record expiration
-            utils.deleteIdempotencyRecord(idempotency_table, messageId)
-
-        else:
-            # NOTE: Messages which are not deleted (due to an Exception) will remain in the queue and be retried
-            # after the lambda returns a RuntimeError (due to the failed message(s))
-            # This scheme allows a lambda to _partially_ fail a batch.
-            sqs.delete_message(
-                QueueUrl=sqs_incomingmessagequeue,
-                ReceiptHandle=record['receiptHandle']
-            )
-
-        finally:
-            if lock_uuid:
-                unlocked = utils.unlockUsersGameState(gamestate_table, user_number, lock_uuid)
-                if not unlocked:
-                    err = "Failed to unlock '{}'".format(user_number)
+    deferred_messages = 0 # Number of messages not started, because they were not predicted to finish before the timeout.
+    record_durations_ms = [] # Execution time of each record started by this invocation, for predicting the cost of the next
+    history_records = [] # Game history returned by commands, recorded in a single batch once the messages are handled
+    history_write_ms = 500 # Time reserved for recording the game history (a single batch write)
+    try:
+        for record_index, record in enumerate(event['Records']):
+
+            # Stop starting records once the next one is not predicted to finish before the Lambda timeout. Timing out mid-record
+            # would leave locks and an idempotency record behind, and return the *entire* batch to the queue. Time is also
+            # reserved for recording the game history, which happens after the last record.
+            if not utils.hasTimeForRecord(context, utils.predictRecordCostMillis(record_durations_ms), reserved_ms=history_write_ms):
+                deferred_records = event['Records'][record_index:]
+                deferred_messages = len(deferred_records)
+                try:
+                    # Deferred records hold no locks or idempotency records, so they may be retried (after a short backoff)
+                    for messageId in utils.releaseMessages(sqs, sqs_incomingmessagequeue, deferred_records):
+                        logging.warning("Failed to release deferred messageId '{}'".format(messageId))
+                except Exception as e:
+                    # Not fatal: the messages will be retried once their visibility timeout expires
+                    logging.warning("Failed to release {} deferred messages".format(deferred_messages), exc_info=True)
+                logging.warning("Deferred {} of {} messages, with {}ms remaining".format(deferred_messages, len(event['Records']), context.get_remaining_time_in_millis()))
+                break
+
+            messageId = record['messageId']
+            record_start = time.monotonic()
+
+            # We scope these above the try, as we'll need them in the finally for lock-clearing
+            lock_uuid = None
+            user_number = None
+            try:
+                # insertIdempotencyRecord() returns False if it failed to insert a record, because of an existing (and not expired) record
+                # (In the event of another failure, it raises an Exception)
+                if not utils.insertIdempotencyRecord(idempotency_table, messageId):
+                    idempotency_skips += 1
+                    continue
+
+                # NOTE: Behavior here seems inconsistent. Examples suggest event record body is a dict, but in-practice it seems to be string.
+                record_body = record['body']
+                if isinstance(record['body'], str):
+                    record_body = json.loads(record_body)
+
+                message = record_body['Message']
+                message = json.loads(message)
+
+                message_content = message['messageBody']
+                user_number = message['originationNumber']
+                outgoing_number = message['destinationNumber']
+
+                lock_uuid = utils.lockUsersGameState(gamestate_table, user_number)
+                if lock_uuid is None:
+                    err = "Failed to lock '{}'".format(user_number)
                     logging.error(err)
                     raise RuntimeError(err)
                 else:
-                    logging.info("Successfully cleared lock '{}' on requestor ('{}')".format(lock_uuid, user_number))
+                    logging.info("Successfully acquired lock '{}' on requestor ('{}')".format(lock_uuid, user_number))
+
+                result = routeRequest(gamestate_table, nickname_table, pending_table, history_table, user_number, message_content)
+                if result.history_records:
+                    history_records.extend(result.history_records)
+
+                # History queued earlier in this invocation for a player who has now quit must not be written (recreating
+                # their history after it was deleted)
+                if result.deleted_user_number is not None:
+                    history_records = [history_record for history_record in history_records if history_record['phone_number'] != result.deleted_user_number]
+
+                utils.sendResultToRequestor_SMS(user_number, result.message, pinpoint_client, pinpoint_appid, outgoing_number)
 
+                if result.other_user_number is not None and result.other_user_message is not None:
+                    utils.sendResultToRequestor_SMS(result.other_user_number, result.other_user_message, pinpoint_client, pinpoint_appid, outgoing_number)
 
-    if failed_messages:
-        raise RuntimeError("Failed to process {} of {} messages.".format(failed_messages, len(event['Records'])))
+            except Exception as e:
+                logging.error("Failed to process messageId '{}'".format(messageId), exc_info=True)
+                failed_messages += 1
+                # Remove the idempotency record, so another execution may (re)try without waiting out the record expiration
+                utils.deleteIdempotencyRecord(idempotency_table, messageId)
+
+            else:
+                # NOTE: Messages which are not deleted (due to an Exception) will remain in the queue and be retried
+                # after the lambda returns a RuntimeError (due to the failed message(s))
+                # This scheme allows a lambda to _partially_ fail a batch.
+                sqs.delete_message(
+                    QueueUrl=sqs_incomingmessagequeue,
+                    ReceiptHandle=record['receiptHandle']
+                )
+
+            finally:
+                record_durations_ms.append((time.monotonic() - record_start) * 1000)
+
+                if lock_uuid:
+                    unlocked = utils.unlockUsersGameState(gamestate_table, user_number, lock_uuid)
+                    if not unlocked:
+                        err = "Failed to unlock '{}'".format(user_number)
+                        logging.error(err)
+                        raise RuntimeError(err)
+                    else:
+                        logging.info("Successfully cleared lock '{}' on requestor ('{}')".format(lock_uuid, user_number))
+
+    finally:
+        # Recording history is best-effort: a failure here must not fail (and retry) messages whose games already resolved
+        if history_records:
+            try:
+                utils.writeGameHistory(history_table, history_records)
+            except Exception as e:
+                logging.error("Failed to record {} game history records".format(len(history_records)), exc_info=True)
+
+
+    if failed_messages or deferred_messages:
+        raise RuntimeError("Failed to process {} and deferred {} of {} messages.".format(failed_messages, deferred_messages, len(event['Records'])))
 
     # NOTE: We raise an exception here so that skipped messages are retried (if they weren't processed (and therefore
     # deleted) by another lambda execution). This ensures our successful return doesn't mark those messages "processed"
@@ -113,11 +158,13 @@ def lambda_handler(event, context):
         }
 
 
-def routeRequest(gamestate_table, nickname_table, requestor_number, message):
+def routeRequest(gamestate_table, nickname_table, pending_table, history_table, requestor_number, message):
     """
     Attempt to parse and route message from requestor
     @param gamestate_table: Boto3 DynamoDB Resource Table instance for GameState Table
     @param nickname_table: Boto3 DynamoDB Resource Table instance for Nickname Table
+    @param pending_table: Boto3 DynamoDB Resource Table instance for PendingGame Table
+    @param history_table: Boto3 DynamoDB Resource Table instance for GameHistory Table
     @param requestor_number: E.164 phone number of user
     @param message: Message to be parsed and routed
     """
@@ -131,10 +178,13 @@ def routeRequest(gamestate_table, nickname_table, requestor_number, message):
         return commands.setNick(nickname_table, gamestate_table, requestor_number, params)
 
     elif command == 'throw' or command == 't' or command == 'play' or command == 'p':
-        return commands.throw(nickname_table, gamestate_table, requestor_number, params)
+        return commands.throw(nickname_table, gamestate_table, pending_table, requestor_number, params)
 
     elif command == 'quit' or command == 'stop':
-        return commands.quitGame(nickname_table, gamestate_table, requestor_number)
+        return commands.quitGame(nickname_table, gamestate_table, pending_table, history_table, requestor_number)
+
+    elif command == 'history' or command == 'h':
+        return commands.showHistory(gamestate_table, history_table, requestor_number, params)
 
     elif command == 'help' or command == '?':
         return commands.helpDoc(params)
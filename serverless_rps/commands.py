@@ -1,15 +1,19 @@
 from dataclasses import dataclass
 import utils
+import variants
 import re
+import time
 import logging
 
 @dataclass
 class CommandResult:
-    """ Data class for storing the result of a command (status/success, message to user, optional message to another user) """
+    """ Data class for storing the result of a command (status/success, message to user, optional message to another user, optional game history to record, optional deleted user) """
     status: int
     message: str
     other_user_number: str = None
     other_user_message: str = None
+    history_records: list = None
+    deleted_user_number: str = None
 
 
 def setNick(nickname_table, gamestate_table, requestor_number, params):
@@ -35,29 +39,41 @@ def setNick(nickname_table, gamestate_table, requestor_number, params):
         return CommandResult(200, "Registered nickname {}".format(params))
 
 
-def throw(nickname_table, gamestate_table, requestor_number, params):
+def throw(nickname_table, gamestate_table, pending_table, requestor_number, params):
     """
-    Play the game! Issue a Rock, Paper, or Scissors throw against some KNOWN 'nick'
+    Play the game! Issue a Rock, Paper, or Scissors (or another variant's) throw against some KNOWN 'nick'
     @param nickname_table: Boto3 DynamoDB Resource Table instance for Nickname Table
     @param gamestate_table: Boto3 DynamoDB Resource Table instance for GameState Table
+    @param pending_table: Boto3 DynamoDB Resource Table instance for PendingGame Table
     @param requestor_number: E.164 phone number of user
-    @param params: String of format '<throw> <other_player>', where <throw> is an acceptable throw and <other_player> is a KNOWN player nick.
+    @param params: String of format '<throw> <other_player> [<variant>]', where <throw> is an acceptable throw, <other_player> is a KNOWN player nick,
+                   and <variant> is an optional game variant name (when answering a throw, the variant of that throw is used)
     @rtype: CommandResult
     """
 
     if not params:
         return CommandResult(400, "Throw command requires arguments <play> and <other_player_nick>.\n\nReply 'help throw' for details.")
 
-    split = params.split(None, 1)
-    if len(split) != 2:
+    split = params.split(None, 2)
+    if len(split) < 2:
         return CommandResult(400, "Throw command requires arguments <play> and <other_player_nick>.\n\nReply 'help throw' for details.")
 
     play = split[0].lower()
-    play = utils.getRockPaperScissorsPlayFromLeftSubstring(play)
     other_player_nick = split[1]
 
-    if play is None:
-        return CommandResult(400, "<play> for throw command must be one of 'rock', 'paper' or 'scissors'.\n\nReply 'help throw' for details.")
+    requested_variant = None
+    if len(split) == 3:
+        requested_variant = variants.getVariant(split[2])
+        if requested_variant is None:
+            return CommandResult(400, "<variant> for throw command must be one of {}.\n\nReply 'help throw' for details.".format(formatChoices(variants.VARIANTS.keys())))
+
+    # Reject bad plays before any reads or locking. Without a <variant>, the variant isn't known until the pending games are
+    # read (under the pair lock), so only plays that no variant accepts can be rejected here
+    if requested_variant is not None:
+        if requested_variant.resolvePlay(play) is None:
+            return CommandResult(400, "<play> for throw command must be one of {}.\n\nReply 'help throw' for details.".format(formatChoices(requested_variant.moves)))
+    elif not variants.isPlayInAnyVariant(play):
+        return CommandResult(400, "<play> for throw command must be one of {}.\n\nReply 'help throw' for details.".format(formatChoices(variants.getVariant(None).moves)))
 
     gamestate = utils.getUserGameState(gamestate_table, requestor_number)
 
@@ -67,95 +83,152 @@ def throw(nickname_table, gamestate_table, requestor_number, params):
     nickname = gamestate['nickname']
     display_name = gamestate['display_name']
 
-    other_player_gamestate = utils.getUserGameStateByNickname(nickname_table, gamestate_table, other_player_nick.lower())
+    # The Nickname record has everything needed of the other player, so their GameState is never read
+    other_player_nick_record = utils.getNicknameRecord(nickname_table, other_player_nick)
 
-    if other_player_gamestate is None:
+    if other_player_nick_record is None:
         return CommandResult(404, "No player is currently registered with the nickname '{}'.".format(other_player_nick))
 
-    other_player_number = other_player_gamestate['phone_number']
-    other_player_nick = other_player_gamestate['nickname']
-    other_player_display_name = other_player_gamestate['display_name']
+    other_player_number = other_player_nick_record['phone_number']
+    other_player_nick = other_player_nick_record['nickname']
+    other_player_display_name = other_player_nick_record['display_name']
+
+    if other_player_number == requestor_number:
+        return CommandResult(400, "You can't play against yourself!")
 
-    other_player_lock_uuid = utils.lockUsersGameState(gamestate_table, other_player_number)
-    if other_player_lock_uuid is None:
-        err = "Failed to lock '{}' (other player for throw)".format(other_player_number)
+    # Games thrown before either player registered were abandoned by a previous owner of the phone number or nickname
+    registered_timestamp = max(int(gamestate.get('registered_timestamp', 0)), int(other_player_nick_record.get('registered_timestamp', 0)))
+
+    # Only the games between this pair of players are locked, so throws against the same player by others may proceed in parallel
+    pair_lock_uuid = utils.lockPlayerPair(pending_table, requestor_number, other_player_number)
+    if pair_lock_uuid is None:
+        err = "Failed to lock '{}' and '{}' (player pair for throw)".format(requestor_number, other_player_number)
         logging.error(err)
         raise RuntimeError(err)
     else:
-        logging.info("Successfully acquired lock '{}' on '{}' (other player for throw)".format(other_player_lock_uuid, other_player_number))
+        logging.info("Successfully acquired lock '{}' on '{}' and '{}' (player pair for throw)".format(pair_lock_uuid, requestor_number, other_player_number))
 
     try:
 
-        requestor_games = {}
-        if 'games' in gamestate.keys():
-            requestor_games = gamestate['games']
-            requestor_games = utils.removeAbandonedGames(nickname_table, requestor_games)
-
-        other_player_games = {}
-        if 'games' in other_player_gamestate.keys():
-            other_player_games = other_player_gamestate['games']
-            other_player_games = utils.removeAbandonedGames(nickname_table, other_player_games)
-
         # Check this player for an existing game! No sneaky-changing throws!
-        if other_player_nick in requestor_games.keys():
-            return CommandResult(403, "You already played {} against {}!".format(requestor_games[other_player_nick], other_player_nick))
+        requestor_game = utils.getPendingGame(pending_table, requestor_number, other_player_nick, other_player_number, registered_timestamp)
+        if requestor_game is not None:
+            return CommandResult(403, "You already played {} against {}!".format(requestor_game['play'], other_player_nick))
+
+        # If the other_player has a pending play/throw against this player, it determines the variant being played
+        other_player_game = utils.getPendingGame(pending_table, other_player_number, nickname, requestor_number, registered_timestamp)
+        variant = requested_variant or variants.getVariant(None)
+        if other_player_game is not None:
+            variant = variants.getVariant(other_player_game.get('variant'))
+            if requested_variant is not None and requested_variant is not variant:
+                return CommandResult(400, "{} challenged you to {}. Reply without a <variant> to answer.".format(other_player_display_name, variant.description))
+
+        play_index = variant.resolvePlay(play)
+        if play_index is None:
+            return CommandResult(400, "<play> for throw command must be one of {}.\n\nReply 'help throw' for details.".format(formatChoices(variant.moves)))
+        play = variant.moves[play_index]
 
         # If the other_player has a pending play/throw against this player (so we can now calculate the winner)
-        if nickname in other_player_games.keys():
-            other_player_play = other_player_games.pop(nickname) # NOTE: We specifically pop the game out of the dict!
+        if other_player_game is not None:
+            other_player_play = other_player_game['play']
+
+            # Before we determine the winner and message the players, clear the (now resolved) game.
+            utils.deletePendingGame(pending_table, other_player_number, nickname)
 
-            # Before we determine the winner and message the players, update the gamestate.
-            utils.updateUserGameState(gamestate_table, other_player_number, other_player_games)
-            utils.updateUserGameState(gamestate_table, requestor_number, requestor_games)
+            winner = variant.isPlayerWinner(play_index, variant.resolvePlay(other_player_play))
 
-            winner = utils.isPlayerWinner(play, other_player_play)
+            # Game history is returned for the caller to record (in a batch) after replying, rather than written here
+            timestamp_ms = int(time.time() * 1000)
+            game_id = utils.newGameHistoryId(timestamp_ms)
+            history_records = [
+                utils.encodeGameHistory(requestor_number, other_player_display_name, play, other_player_play, winner, timestamp_ms, game_id, variant.name),
+                utils.encodeGameHistory(other_player_number, display_name, other_player_play, play, None if winner is None else not winner, timestamp_ms, game_id, variant.name)
+            ]
 
             if winner is None:
                 return CommandResult(200, "You tied with {}".format(other_player_display_name),
                                      other_user_number=other_player_number,
-                                     other_user_message="You tied with {}".format(display_name))
+                                     other_user_message="You tied with {}".format(display_name),
+                                     history_records=history_records)
             elif winner:
                 return CommandResult(200, "You beat {}!".format(other_player_display_name),
                                      other_user_number=other_player_number,
-                                     other_user_message="{} beat you".format(display_name))
+                                     other_user_message="{} beat you".format(display_name),
+                                     history_records=history_records)
             else:
                 return CommandResult(200, "{} beat you".format(other_player_display_name),
                                      other_user_number=other_player_number,
-                                     other_user_message="You beat {}!".format(display_name))
+                                     other_user_message="You beat {}!".format(display_name),
+                                     history_records=history_records)
 
         else:
-            requestor_games[other_player_nick] = play
+            utils.putPendingGame(pending_table, requestor_number, other_player_nick, other_player_number, play, variant.name)
 
-            # Update each player's gamestate (NOTE: other_player's game state will only have changed if stale games were cleared)
-            utils.updateUserGameState(gamestate_table, other_player_number, other_player_games)
-            utils.updateUserGameState(gamestate_table, requestor_number, requestor_games)
+            other_user_message = "{} is waiting for you to play against them".format(display_name)
+            if variant.name != variants.DEFAULT_VARIANT:
+                other_user_message += " ({}: {})".format(variant.description, ", ".join(variant.moves))
 
             return CommandResult(200, "Waiting for {}".format(other_player_display_name),
                                  other_user_number=other_player_number,
-                                 other_user_message="{} is waiting for you to play against them".format(display_name))
+                                 other_user_message=other_user_message)
 
 
     finally: # In case of exception, we use a finally to attempt to unlock, to ensure we don't leave stale locks!
-        unlocked = utils.unlockUsersGameState(gamestate_table, other_player_number, other_player_lock_uuid)
+        unlocked = utils.unlockPlayerPair(pending_table, requestor_number, other_player_number, pair_lock_uuid)
         if not unlocked:
-            err = "Failed to unlock '{}' (other player for throw)".format(other_player_number)
+            err = "Failed to unlock '{}' and '{}' (player pair for throw)".format(requestor_number, other_player_number)
             logging.error(err)
             raise RuntimeError(err)
         else:
-            logging.info("Successfully cleared lock '{}' on '{}' (other player for throw)".format(other_player_lock_uuid, other_player_number))
+            logging.info("Successfully cleared lock '{}' on '{}' and '{}' (player pair for throw)".format(pair_lock_uuid, requestor_number, other_player_number))
+
+
+def showHistory(gamestate_table, history_table, requestor_number, params):
+    """
+    Show a page of the requestor's finished games, most recent first
+    @param gamestate_table: Boto3 DynamoDB Resource Table instance for GameState Table
+    @param history_table: Boto3 DynamoDB Resource Table instance for GameHistory Table
+    @param requestor_number: E.164 phone number of user
+    @param params: Optional cursor (as sent with the previous page) of the page to show
+    @rtype: CommandResult
+    """
+    cursor = None
+    if params:
+        cursor = params.strip().lower()
+        if not re.match(r"^[0-9a-z]{15}$", cursor):
+            return CommandResult(400, "History command's optional <cursor> must be copied from the end of a previous 'history' reply.\n\nReply 'help history' for details.")
+
+    # Only games since the requestor registered are theirs (a previous owner of the phone number may have left some behind)
+    gamestate = utils.getUserGameState(gamestate_table, requestor_number)
+    if gamestate is None or 'nickname' not in gamestate.keys():
+        return CommandResult(200, "You haven't finished any games yet.")
+
+    games, next_cursor = utils.queryGameHistory(history_table, requestor_number, cursor=cursor, since_timestamp=int(gamestate.get('registered_timestamp', 0)))
+
+    if not games:
+        return CommandResult(200, "No more games." if cursor else "You haven't finished any games yet.")
+
+    lines = ["You {} vs {} ({} v {})".format(game['result'], game['opponent'], game['play'], game['other_player_play']) for game in games]
+
+    if next_cursor is not None:
+        lines.append("Reply 'history {}' for older games.".format(next_cursor))
+
+    return CommandResult(200, "\n".join(lines))
 
 
-def quitGame(nickname_table, gamestate_table, requestor_number):
+def quitGame(nickname_table, gamestate_table, pending_table, history_table, requestor_number):
     """
-    'Quit' the ServerlessRPS system: delete user from GameState table
+    'Quit' the ServerlessRPS system: delete user from GameState table (and their pending games and game history)
     @param nickname_table: Boto3 DynamoDB Resource Table instance for Nickname Table
     @param gamestate_table: Boto3 DynamoDB Resource Table instance for GameState Table
+    @param pending_table: Boto3 DynamoDB Resource Table instance for PendingGame Table
+    @param history_table: Boto3 DynamoDB Resource Table instance for GameHistory Table
     @param requestor_number: E.164 phone number of user
     @rtype: CommandResult
     """
-    utils.deleteUser(nickname_table, gamestate_table, requestor_number)
+    utils.deleteUser(nickname_table, gamestate_table, pending_table, history_table, requestor_number)
 
-    return CommandResult(200, "Your record has been deleted, and your nickname unregistered.")
+    return CommandResult(200, "Your record has been deleted, and your nickname unregistered.", deleted_user_number=requestor_number)
 
 
 def helpDoc(command=None):
@@ -165,7 +238,8 @@ def helpDoc(command=None):
     """
     helpDoc = "Commands:\n\n" + \
         "nick <nickname>: register nickname\n\n" + \
-        "throw <play> <other_player_nick>: play against another player\n\n" + \
+        "throw <play> <other_player_nick> [<variant>]: play against another player\n\n" + \
+        "history: list finished games\n\n" + \
         "quit: delete player data\n\n" + \
         "help <command>: command-specific help"
 
@@ -179,15 +253,21 @@ def helpDoc(command=None):
                 "Nickname must be unique, and alphanumeric (letters, numbers and underscores; no spaces)."
 
         elif command == 'throw':
-            helpDoc = "throw <play> <other_player_nick>\n\n" + \
+            helpDoc = "throw <play> <other_player_nick> [<variant>]\n\n" + \
                 "Play against another player (you must know their nickname).\n\n" + \
-                "<play> must be one of rock (or r), paper (p), or scissors (s)."
+                "<variant> is optional: rps (default), rpsls (adds lizard and spock), rps7, or rps15. When answering another player's throw, their variant is used.\n\n" + \
+                "In rps, <play> must be one of rock (or r), paper (p), or scissors (s). In other variants, <play> may be shortened only as far as it is unambiguous (e.g., 'sc' for scissors and 'sp' for spock)."
+
+        elif command == 'history':
+            helpDoc = "history [<cursor>]\n\n" + \
+                "List your finished games, most recent first.\n\n" + \
+                "<cursor> is optional; when there are older games, the reply ends with the 'history <cursor>' to send next."
 
         elif command == 'quit':
             helpDoc = "quit\n\n" + \
                 "Issuing this command will clear your player data!\n\n" + \
                 "Your nickname will be unregistered (and may be registered by other users).\n\n" + \
-                "All in-progress games will be lost."
+                "All in-progress games, and your game history, will be lost."
 
         else:
             helpDoc = "No specific help doc available for '{}'".format(command)
@@ -195,6 +275,17 @@ def helpDoc(command=None):
     return CommandResult(200, helpDoc)
 
 
+def formatChoices(choices):
+    """
+    Format choices for display, e.g., "'rock', 'paper' or 'scissors'"
+    @param choices: Iterable of choice strings
+    @return: Returns formatted string
+    """
+    quoted = ["'{}'".format(choice) for choice in choices]
+
+    return ", ".join(quoted[:-1]) + " or " + quoted[-1]
+
+
 def unknownCommand(gamestate_table, requestor_number, message):
     """
     Handled unparsable messages, unknown commands, etc..
@@ -2,7 +2,9 @@ import logging
 import re
 import time
 import uuid
+from boto3.dynamodb.conditions import Key
 from botocore.exceptions import ClientError
+import variants
 
 def insertIdempotencyRecord(table, messageId, expires_in_sec=10):
     """
@@ -47,6 +49,63 @@ def deleteIdempotencyRecord(table, messageId):
     )
 
 
+def predictRecordCostMillis(record_durations_ms, default_ms=2000):
+    """
+    Predict the execution time of the next record, based on the records already processed by this invocation
+    @param record_durations_ms: List of execution times (milliseconds) of previously processed records
+    @param default_ms: Prediction used before any record has been processed (default 2000 milliseconds)
+    @return: Predicted milliseconds needed to process another record (the slowest observed record, so the prediction is pessimistic)
+    """
+    if not record_durations_ms:
+        return default_ms
+
+    return max(record_durations_ms)
+
+
+def hasTimeForRecord(context, predicted_cost_ms, reserved_ms=0, safety_margin_ms=1000):
+    """
+    Check if the invocation has enough remaining time to start (and finish) another record
+    @param context: Lambda context object (provides get_remaining_time_in_millis())
+    @param predicted_cost_ms: Predicted milliseconds needed to process the record
+    @param reserved_ms: Milliseconds needed by work done after the last record (e.g., recording game history) (default 0)
+    @param safety_margin_ms: Milliseconds to hold in reserve for unlocking, cleanup, and returning (default 1000 milliseconds)
+    @return: Boolean: True iff the predicted cost (plus reserve and margin) fits in the remaining time
+    """
+    return context.get_remaining_time_in_millis() > predicted_cost_ms + reserved_ms + safety_margin_ms
+
+
+def releaseMessages(sqs_client, queue_url, records, backoff_sec=10):
+    """
+    Return (unprocessed) messages to the queue after a short backoff, rather than waiting out their visibility timeout.
+    The backoff is non-zero, so a slow dependency doesn't cause rapid redelivery (spending the messages' receive counts).
+    @param sqs_client: Boto3 SQS Client instance
+    @param queue_url: URL of the queue the messages were received from
+    @param records: List of SQS event records (dicts with 'messageId' and 'receiptHandle')
+    @param backoff_sec: Seconds until the messages may be received again (default 10 seconds)
+    @return: Returns list of messageIds which could not be released (they will be retried once their visibility timeout expires)
+    """
+    failed = []
+
+    # ChangeMessageVisibilityBatch accepts at most 10 entries
+    for start in range(0, len(records), 10):
+        batch = records[start:start + 10]
+
+        resp = sqs_client.change_message_visibility_batch(
+            QueueUrl=queue_url,
+            Entries=[
+                {
+                    'Id': str(index),
+                    'ReceiptHandle': record['receiptHandle'],
+                    'VisibilityTimeout': backoff_sec
+                } for index, record in enumerate(batch)
+            ]
+        )
+
+        failed.extend(batch[int(entry['Id'])]['messageId'] for entry in resp.get('Failed', []))
+
+    return failed
+
+
 def userExistsInGameStateTable(gamestate_table, user_number):
     """
     Check the given phone number has a record in the GameState table
@@ -64,23 +123,6 @@ def userExistsInGameStateTable(gamestate_table, user_number):
     return 'Item' in resp
 
 
-def nicknameExists(nickname_table, nickname):
-    """
-    Check if the given nickname exists in the Nickname Table
-    @param nickname_table: Boto3 DynamoDB Resource Table instance for Nickname Table
-    @param nickname: Nickname to query for
-    @return: Boolean existence of nickname record
-    """
-    resp = nickname_table.get_item(
-        Key={
-            'nickname': nickname.lower(),
-        },
-        ConsistentRead=True
-    )
-
-    return 'Item' in resp
-
-
 def lockUsersGameState(gamestate_table, user_number, lock_attribute='user_locked', expires_in_sec=10):
     """
     Test-and-set a lock attribute (with UUID and expiration timestamp (unix epoch)) on the given user in the GameState Table
@@ -146,18 +188,80 @@ def unlockUsersGameState(gamestate_table, user_number, lock_uuid, lock_attribute
     return True
 
 
-def updateUserGameState(gamestate_table, user_number, games_dict):
+def getPlayerPairLockKey(user_number, other_user_number):
     """
-    Update the given user's games dict in the GameState table
-    @param gamestate_table: Boto3 DynamoDB Resource Table instance for GameState Table
+    Get the PendingGame Table key of the lock for the given pair of players (the same key, regardless of argument order)
     @param user_number: E.164 phone number of user
-    @param games_dict: Pending games dict (keyed by nickname of other player and valued by 'rock', 'paper' or 'scissors'
+    @param other_user_number: E.164 phone number of other user
+    @return: Returns key dict
     """
-    response = gamestate_table.update_item(
-        Key={'phone_number': user_number},
-        UpdateExpression="set games = :games_dict",
-        ExpressionAttributeValues={':games_dict': games_dict}
-    )
+    # Sort keys of game records are nicknames (which may only contain word characters), so a '#' prefix cannot collide
+    first_number, second_number = sorted([user_number, other_user_number])
+
+    return {'phone_number': first_number, 'opponent': '#' + second_number}
+
+
+def lockPlayerPair(pending_table, user_number, other_user_number, lock_attribute='pair_locked', expires_in_sec=10):
+    """
+    Test-and-set a lock (with UUID and expiration timestamp (unix epoch)) on the games between the given pair of players
+    @param pending_table: Boto3 DynamoDB Resource Table instance for PendingGame Table
+    @param user_number: E.164 phone number of user
+    @param other_user_number: E.164 phone number of other user
+    @param lock_attribute: Name of lock attribute (default 'pair_locked')
+    @param expires_in_sec: Seconds from current unix epoch timestamp to consider this lock expired (default 10 seconds)
+    @return: Returns UUID string of lock iff lock was successfully acquired. Returns None on failure (i.e., pair already locked)
+    """
+
+    lock_uuid = uuid.uuid1().hex
+
+    lock = {
+        'lock_uuid': lock_uuid,
+        'expiration_epoch_timestamp': int(time.time() + expires_in_sec)
+    }
+
+    try:
+        response = pending_table.update_item(
+            Key=getPlayerPairLockKey(user_number, other_user_number),
+            UpdateExpression="set {} = :lock_dict".format(lock_attribute),
+            ConditionExpression="attribute_not_exists({})".format(lock_attribute),
+            ExpressionAttributeValues={':lock_dict': lock}
+        )
+
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException': # ConditionalCheckFailedException => Lock Exists
+            return None
+        else:
+            raise e
+
+    return lock_uuid
+
+
+def unlockPlayerPair(pending_table, user_number, other_user_number, lock_uuid, lock_attribute='pair_locked'):
+    """
+    Release lock (with specified UUID) on the games between the given pair of players
+    @param pending_table: Boto3 DynamoDB Resource Table instance for PendingGame Table
+    @param user_number: E.164 phone number of user
+    @param other_user_number: E.164 phone number of other user
+    @param lock_uuid: UUID of lock to be removed.
+    @param lock_attribute: Name of lock attribute (default 'pair_locked')
+    @return: Returns True iff lock with given UUID was successfully removed. Otherwise, returns False
+    """
+
+    # Unlike player locks, the lock record exists only to hold the lock, so it is deleted (rather than the attribute removed)
+    try:
+        response = pending_table.delete_item(
+            Key=getPlayerPairLockKey(user_number, other_user_number),
+            ConditionExpression="{}.lock_uuid = :lock_uuid".format(lock_attribute),
+            ExpressionAttributeValues={':lock_uuid': lock_uuid}
+        )
+
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':  # ConditionalCheckFailedException => Lock Exists
+            return False
+        else:
+            raise e
+
+    return True
 
 
 def sendResultToRequestor_SMS(destination_number, message, pinpoint_client, pinpoint_appid, origination_number, debug=False):
@@ -192,11 +296,13 @@ def sendResultToRequestor_SMS(destination_number, message, pinpoint_client, pinp
         logging.info("Would have sent SMS message '{}' to '{}' via Pinpoint AppId '{}' using phone number '{}'".format(message, destination_number, pinpoint_appid, origination_number))
 
 
-def deleteUser(nickname_table, gamestate_table, user_number):
+def deleteUser(nickname_table, gamestate_table, pending_table, history_table, user_number):
     """
-    Delete user and de-register their nickname
+    Delete user (including their pending games and game history) and de-register their nickname
     @param nickname_table: Boto3 DynamoDB Resource Table instance for Nickname Table
     @param gamestate_table: Boto3 DynamoDB Resource Table instance for GameState Table
+    @param pending_table: Boto3 DynamoDB Resource Table instance for PendingGame Table
+    @param history_table: Boto3 DynamoDB Resource Table instance for GameHistory Table
     @param user_number: E.164 phone number of user
     """
 
@@ -220,6 +326,9 @@ def deleteUser(nickname_table, gamestate_table, user_number):
             }
         )
 
+    deletePendingGames(pending_table, user_number)
+    deleteGameHistory(history_table, user_number)
+
 
 def setUserNickname(nickname_table, gamestate_table, user_number, nickname):
     """
@@ -236,9 +345,12 @@ def setUserNickname(nickname_table, gamestate_table, user_number, nickname):
     # NOTE: We key the table by the lowercase nickname (for uniqueness), and store the original as 'display_name'
     nickname_lowercase = nickname.lower()
 
+    # Records of a previous owner of this phone number or nickname (left behind when they quit) predate this timestamp
+    registered_timestamp = int(time.time() * 1000)
+
     try:
         nickname_table.put_item(
-            Item={'nickname': nickname_lowercase, 'phone_number': user_number, 'display_name': nickname},
+            Item={'nickname': nickname_lowercase, 'phone_number': user_number, 'display_name': nickname, 'registered_timestamp': registered_timestamp},
             ConditionExpression="attribute_not_exists(nickname)"
         )
     except ClientError as e:
@@ -250,10 +362,11 @@ def setUserNickname(nickname_table, gamestate_table, user_number, nickname):
     # Denormalize nickname onto gamestate record for efficient phone_number -> nickname lookups (without an extra index on nickname table)
     gamestate_table.update_item(
         Key={'phone_number': user_number},
-        UpdateExpression="SET nickname = :nickname, display_name = :display_name",
+        UpdateExpression="SET nickname = :nickname, display_name = :display_name, registered_timestamp = :registered_timestamp",
         ExpressionAttributeValues={
             ':nickname': nickname_lowercase,
-            ':display_name': nickname
+            ':display_name': nickname,
+            ':registered_timestamp': registered_timestamp
         }
     )
 
@@ -300,95 +413,313 @@ def getUserGameState(gamestate_table, user_number):
         return None
 
 
-def getUserGameStateByNickname(nickname_table, gamestate_table, nickname):
+def getPendingGame(pending_table, user_number, opponent_nickname, opponent_number, since_timestamp=0):
     """
-    Get player's GameState record, using their nickname
-    @param nickname_table: Boto3 DynamoDB Resource Table instance for Nickname Table
-    @param gamestate_table: Boto3 DynamoDB Resource Table instance for GameState Table
-    @param nickname: User nickname to query
-    @return: Returns record dict if found, otherwise None
+    Get the user's pending game (i.e., their throw, awaiting the other player's) against the given opponent.
+    Games abandoned by either player (i.e., they quit, and the phone number or nickname now belongs to another player) are
+    removed, and expired games (awaiting removal by DynamoDB's TTL mechanism) are ignored.
+    @param pending_table: Boto3 DynamoDB Resource Table instance for PendingGame Table
+    @param user_number: E.164 phone number of user
+    @param opponent_nickname: (Lowercase) nickname of the other player
+    @param opponent_number: E.164 phone number of the other player
+    @param since_timestamp: Unix epoch timestamp (milliseconds) at which the later of the two players registered; older games were abandoned (default 0)
+    @return: Returns PendingGame record dict if found, otherwise None
     """
-
-    nick_record = getNicknameRecord(nickname_table, nickname)
-
-    if nick_record is None:
-        return None
-
-    resp = gamestate_table.get_item(
+    resp = pending_table.get_item(
         Key={
-            'phone_number': nick_record['phone_number'],
+            'phone_number': user_number,
+            'opponent': opponent_nickname
         },
         ConsistentRead=True
     )
 
-    if 'Item' in resp:
-        return resp['Item']
-    else:
+    if 'Item' not in resp:
         return None
 
+    game = resp['Item']
 
-def removeAbandonedGames(nickname_table, games):
+    # Games predating the 'throw_timestamp' attribute are treated as thrown at 0 (i.e., before any registration it's compared to)
+    if game['opponent_number'] != opponent_number or int(game.get('throw_timestamp', 0)) < since_timestamp:
+        deletePendingGame(pending_table, user_number, opponent_nickname)
+        return None
+
+    if 'TTLEpochTimestamp' in game and int(game['TTLEpochTimestamp']) < int(time.time()):
+        return None
+
+    return game
+
+
+def putPendingGame(pending_table, user_number, opponent_nickname, opponent_number, play, variant=variants.DEFAULT_VARIANT, overwrite=True, expires_in_sec=30 * 24 * 60 * 60):
     """
-    Checks games dict against the nickname table and removes entries for which nickname is not registered (user quit)
-    @param nickname_table: Boto3 DynamoDB Resource Table instance for Nickname Table
-    @param games: Dict of in-progress/pending games (keyed by other player nickname)
-    @return: Returns dict sans games for which other player nickname does not exist
+    Record the user's throw against the given opponent, pending the other player's throw
+    @param pending_table: Boto3 DynamoDB Resource Table instance for PendingGame Table
+    @param user_number: E.164 phone number of user
+    @param opponent_nickname: (Lowercase) nickname of the other player
+    @param opponent_number: E.164 phone number of the other player (to detect the nickname later belonging to another player)
+    @param play: One of 'rock', 'paper', or 'scissors' (or another variant's move)
+    @param variant: Name of game variant (default 'rps')
+    @param overwrite: Whether to replace an existing pending game against the opponent (default True)
+    @param expires_in_sec: Seconds from current unix epoch timestamp until the game is abandoned, and removed by DynamoDB's TTL mechanism (default 30 days)
+    @return: Returns the PendingGame record dict, or None if a game already existed (and overwrite is False)
+    """
+    game = {
+        'phone_number': user_number,
+        'opponent': opponent_nickname,
+        'opponent_number': opponent_number,
+        'play': play,
+        'variant': variant,
+        'throw_timestamp': int(time.time() * 1000),
+        'TTLEpochTimestamp': int(time.time()) + expires_in_sec
+    }
+
+    if overwrite:
+        pending_table.put_item(Item=game)
+        return game
+
+    try:
+        pending_table.put_item(
+            Item=game,
+            ConditionExpression="attribute_not_exists(opponent)"
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':  # ConditionalCheckFailedException => Game Exists
+            return None
+        else:
+            raise e
+
+    return game
+
+
+def deletePendingGame(pending_table, user_number, opponent_nickname):
+    """
+    Remove the user's pending game against the given opponent
+    @param pending_table: Boto3 DynamoDB Resource Table instance for PendingGame Table
+    @param user_number: E.164 phone number of user
+    @param opponent_nickname: (Lowercase) nickname of the other player
     """
-    games_cleaned = games.copy()
+    pending_table.delete_item(
+        Key={
+            'phone_number': user_number,
+            'opponent': opponent_nickname
+        }
+    )
+
+
+def deletePendingGames(pending_table, user_number, limit=10):
+    """
+    Delete (a bounded number of) the user's pending games: both their throws, and other players' throws against them
+    @param pending_table: Boto3 DynamoDB Resource Table instance for PendingGame Table
+    @param user_number: E.164 phone number of user
+    @param limit: Maximum number of records of each kind to read, and so delete (default 10)
+    """
+    # Deletes are bounded, so quitting doesn't exhaust the table's write capacity or the Lambda's timeout, however many games
+    # a player has pending. Any games left behind are never resolved: they predate the registration of whoever next registers
+    # the phone number or nickname (see getPendingGame()), and are removed by DynamoDB's TTL mechanism.
+    user_throws_query = {
+        'KeyConditionExpression': Key('phone_number').eq(user_number),
+        'ProjectionExpression': 'phone_number, opponent',
+        'Limit': limit
+    }
+
+    # The index is eventually consistent, so a throw made moments ago may be missed (and left behind, as above)
+    throws_against_user_query = {
+        'IndexName': 'OpponentNumberIndex',
+        'KeyConditionExpression': Key('opponent_number').eq(user_number),
+        'Limit': limit
+    }
+
+    with pending_table.batch_writer() as batch:
+        for query_args in [user_throws_query, throws_against_user_query]:
+            resp = pending_table.query(**query_args)
+
+            for record in resp['Items']:
+                # Skip pair locks (see getPlayerPairLockKey()), which may be held by another player's in-progress throw
+                if not record['opponent'].startswith('#'):
+                    batch.delete_item(Key={'phone_number': record['phone_number'], 'opponent': record['opponent']})
 
-    for nickname in games.keys():
-        if not nicknameExists(nickname_table, nickname):
-            games_cleaned.pop(nickname)
 
-    return games_cleaned
+def newGameHistoryId(timestamp_ms):
+    """
+    Generate a unique, time-ordered GameHistory Table sort key (also used as the 'history' command's cursor)
+    @param timestamp_ms: Unix epoch timestamp (milliseconds) at which the game was resolved
+    @return: Returns 15 character string: the timestamp as 9 (zero-padded) base 36 digits, then 6 random hex digits
+    """
+    # The random suffix keeps games resolved in the same millisecond from colliding
+    return timestampToBase36(timestamp_ms) + uuid.uuid4().hex[:6]
 
 
-def getRockPaperScissorsPlayFromLeftSubstring(play):
+def timestampToBase36(timestamp_ms):
     """
-    Determine if the play is one of rock, paper, scissors (or any substring from the left/start)
-    @param play: One of 'rock', 'paper', or 'scissors' (or any substring from the left/start)
-    @return: Returns one of 'rock', 'paper', or 'scissors' if matched, otherwise returns None
+    Encode a timestamp as the (time-ordered) prefix of a game ID (see newGameHistoryId())
+    @param timestamp_ms: Unix epoch timestamp (milliseconds)
+    @return: Returns 9 character string: the timestamp as 9 (zero-padded) base 36 digits
     """
-    if "rock".startswith(play.lower()):
-        return 'rock'
-    elif "paper".startswith(play.lower()):
-        return 'paper'
-    elif "scissors".startswith(play.lower()):
-        return 'scissors'
+    # Fixed-width, so the IDs sort by time
+    timestamp_digits = ''
+    for _ in range(9):
+        timestamp_ms, digit = divmod(timestamp_ms, 36)
+        timestamp_digits = numberToBase36Digit(digit) + timestamp_digits
+
+    return timestamp_digits
+
+
+def encodeGameHistory(user_number, opponent_display_name, play, other_player_play, winner, timestamp_ms, game_id, variant=variants.DEFAULT_VARIANT, expires_in_sec=365 * 24 * 60 * 60):
+    """
+    Encode a finished game as a (compact) GameHistory Table record, from the perspective of the given user
+    @param user_number: E.164 phone number of user
+    @param opponent_display_name: Display name of the other player (at the time of the game)
+    @param play: This user's play; one of 'rock', 'paper', or 'scissors' (or another variant's move)
+    @param other_player_play: The other player's play; one of 'rock', 'paper', or 'scissors' (or another variant's move)
+    @param winner: Result of GameVariant.isPlayerWinner() for play and other_player_play
+    @param timestamp_ms: Unix epoch timestamp (milliseconds) at which the game was resolved
+    @param game_id: ID of the game, from newGameHistoryId(timestamp_ms) (shared by both players' records of the game)
+    @param variant: Name of game variant (default 'rps')
+    @param expires_in_sec: Seconds from timestamp_ms until the record is removed by DynamoDB's TTL mechanism (default 365 days)
+    @return: Returns GameHistory record dict
+    """
+
+    # The game is packed into a single short string: one result character ('W'in, 'L'oss, 'T'ie), followed by one
+    # (base 36) digit per play, indexing the variant's moves. E.g., 'W02' => won, playing rock against scissors.
+    if winner is None:
+        result = 'T'
+    elif winner:
+        result = 'W'
     else:
-        return None
+        result = 'L'
+
+    game_variant = variants.getVariant(variant)
+    game = result + numberToBase36Digit(game_variant.resolvePlay(play)) + numberToBase36Digit(game_variant.resolvePlay(other_player_play))
+
+    record = {
+        'phone_number': user_number,
+        'game_id': game_id,
+        'game_timestamp': timestamp_ms,
+        'opponent': opponent_display_name,
+        'game': game,
+        'TTLEpochTimestamp': timestamp_ms // 1000 + expires_in_sec
+    }
+
+    # The variant is only stored when it isn't the default (which is also how records predating variants are read)
+    if variant != variants.DEFAULT_VARIANT:
+        record['variant'] = variant
 
+    return record
 
 
-def isPlayerWinner(play, other_player_play):
+def numberToBase36Digit(number):
     """
-    Determine the winner of rock, paper, scissors
-    @param play: One of 'rock', 'paper', or 'scissors' (or any substring from the left/start)
-    @param other_player_play: One of 'rock', 'paper', or 'scissors' (or any substring from the left/start)
-    @return: Returns True if 'play' beats 'other_player_play', False if 'other_player_play' beats 'play', and None if tie.
-                Raises ValueError on bad input
+    Encode a number (0-35) as a single base 36 digit (the inverse of int(digit, 36))
+    @param number: Integer from 0 to 35
+    @return: Returns single character string
     """
+    return '0123456789abcdefghijklmnopqrstuvwxyz'[number]
 
-    play_str = getRockPaperScissorsPlayFromLeftSubstring(play)
-    other_player_play_str = getRockPaperScissorsPlayFromLeftSubstring(other_player_play)
 
-    if play_str is None:
-        raise ValueError("Bad 'play': not one of rock, paper, or scissors.")
-    if other_player_play_str is None:
-        raise ValueError("Bad 'other_player_play': not one of rock, paper, or scissors.")
+def decodeGameHistory(record):
+    """
+    Decode a GameHistory Table record (see encodeGameHistory())
+    @param record: GameHistory record dict
+    @return: Returns dict with 'timestamp_ms', 'opponent', 'variant', 'play', 'other_player_play', and 'result' ('won', 'lost', or 'tied')
+    """
+    game = record['game']
+    variant = record.get('variant', variants.DEFAULT_VARIANT)
+    moves = variants.getVariant(variant).moves
 
-    # PAPER, SCISSORS, ROCK  <=> 0, 1, 2
-    # if i == j: tie
-    # if j == ((i+1) % 3): j beats i
-    # else: i beats j
+    return {
+        'timestamp_ms': int(record['game_timestamp']),
+        'opponent': record['opponent'],
+        'variant': variant,
+        'play': moves[int(game[1], 36)],
+        'other_player_play': moves[int(game[2], 36)],
+        'result': {'W': 'won', 'L': 'lost', 'T': 'tied'}[game[0]]
+    }
 
-    psr = ['paper', 'scissors', 'rock']
-    play_int = psr.index(play_str)
-    other_play_int = psr.index(other_player_play_str)
 
-    if play_int == other_play_int:
-        return None
-    elif other_play_int == ((play_int + 1) % 3 ):
-        return False
+def writeGameHistory(history_table, records):
+    """
+    Append records to the GameHistory Table, using batched writes
+    @param history_table: Boto3 DynamoDB Resource Table instance for GameHistory Table
+    @param records: List of GameHistory record dicts (see encodeGameHistory())
+    """
+    with history_table.batch_writer() as batch:
+        for record in records:
+            batch.put_item(Item=record)
+
+
+def queryGameHistory(history_table, user_number, limit=5, cursor=None, since_timestamp=0):
+    """
+    Get a page of the user's game history, most recent first
+    @param history_table: Boto3 DynamoDB Resource Table instance for GameHistory Table
+    @param user_number: E.164 phone number of user
+    @param limit: Maximum number of games to return (default 5)
+    @param cursor: Cursor (game ID) returned with the previous page (None for the first page)
+    @param since_timestamp: Unix epoch timestamp (milliseconds) at which the user registered; older games are omitted (default 0)
+    @return: Returns tuple of (list of decoded games (see decodeGameHistory()), cursor of next page (None if this is the last page))
+    """
+    # Game IDs are prefixed by their (fixed-width) timestamp, so every game ID since the timestamp sorts after it
+    query_args = {
+        'KeyConditionExpression': Key('phone_number').eq(user_number) & Key('game_id').gt(timestampToBase36(since_timestamp)),
+        'ScanIndexForward': False,
+        'Limit': limit
+    }
+
+    if cursor is not None:
+        query_args['ExclusiveStartKey'] = {'phone_number': user_number, 'game_id': cursor}
+
+    resp = history_table.query(**query_args)
+
+    next_cursor = None
+    if 'LastEvaluatedKey' in resp:
+        next_cursor = resp['LastEvaluatedKey']['game_id']
+
+    return [decodeGameHistory(record) for record in resp['Items']], next_cursor
+
+
+def exportGameHistory(history_table, user_number=None):
+    """
+    Generate every (decoded) game in the GameHistory Table, for bulk export. Pages are fetched lazily.
+    @param history_table: Boto3 DynamoDB Resource Table instance for GameHistory Table
+    @param user_number: E.164 phone number of user to export (default None: export all users)
+    @return: Generates dicts of decoded games (see decodeGameHistory()), each with an added 'phone_number'
+    """
+    if user_number is not None:
+        read = history_table.query
+        read_args = {'KeyConditionExpression': Key('phone_number').eq(user_number)}
     else:
-        return True
+        read = history_table.scan
+        read_args = {}
+
+    while True:
+        resp = read(**read_args)
+
+        for record in resp['Items']:
+            game = decodeGameHistory(record)
+            game['phone_number'] = record['phone_number']
+            yield game
+
+        if 'LastEvaluatedKey' not in resp:
+            break
+
+        read_args['ExclusiveStartKey'] = resp['LastEvaluatedKey']
+
+
+def deleteGameHistory(history_table, user_number, limit=10):
+    """
+    Delete (a bounded number of) the user's game history, most recent first
+    @param history_table: Boto3 DynamoDB Resource Table instance for GameHistory Table
+    @param user_number: E.164 phone number of user
+    @param limit: Maximum number of records to read, and so delete (default 10)
+    """
+    # Deletes are bounded, so quitting doesn't exhaust the table's write capacity or the Lambda's timeout, however long a
+    # player's history is. Any history left behind predates the registration of whoever next registers the phone number, so
+    # it is never shown to them (see queryGameHistory()), and is removed by DynamoDB's TTL mechanism.
+    resp = history_table.query(
+        KeyConditionExpression=Key('phone_number').eq(user_number),
+        ProjectionExpression='phone_number, game_id',
+        ScanIndexForward=False,
+        Limit=limit
+    )
+
+    with history_table.batch_writer() as batch:
+        for record in resp['Items']:
+            batch.delete_item(Key={'phone_number': record['phone_number'], 'game_id': record['game_id']})
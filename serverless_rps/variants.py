@@ -0,0 +1,108 @@
+from dataclasses import dataclass
+
+@dataclass(frozen=True)
+class GameVariant:
+    """ Data class for a cyclic game variant (moves, and the outcome/prefix lookup tables precomputed by buildVariant()) """
+    name: str
+    description: str
+    moves: tuple
+    outcomes: tuple
+    prefixes: dict
+
+    def resolvePlay(self, play):
+        """
+        Determine if the play is one of this variant's moves (or any unambiguous substring from the left/start)
+        @param play: Move name (or any unambiguous substring from the left/start)
+        @return: Returns the index of the move (into 'moves') if matched, otherwise returns None
+        """
+        return self.prefixes.get(play.lower())
+
+    def isPlayerWinner(self, play_index, other_play_index):
+        """
+        Determine the winner of a game
+        @param play_index: Index of the play (into 'moves')
+        @param other_play_index: Index of the other player's play (into 'moves')
+        @return: Returns True if 'play' beats 'other_play', False if 'other_play' beats 'play', and None if tie.
+        """
+        return self.outcomes[play_index][other_play_index]
+
+
+def buildVariant(name, description, moves):
+    """
+    Build a cyclic game variant: with moves arranged in a circle, each move beats the (N-1)/2 moves preceding it (and loses
+    to the (N-1)/2 moves following it). E.g., ('rock', 'paper', 'scissors'): paper beats rock, scissors beats paper, and
+    rock beats scissors (wrapping around).
+    @param name: Short (lowercase) name, used to select the variant
+    @param description: Display name of the variant
+    @param moves: Tuple of an odd number of (lowercase) move names, in cycle order. NOTE: Move indexes are stored (in pending
+                  games and game history), so moves must NEVER be re-ordered!
+    @rtype: GameVariant
+    """
+    n = len(moves)
+    if n < 3 or n % 2 == 0:
+        raise ValueError("Variant '{}' must have an odd number (at least 3) of moves".format(name))
+
+    # outcomes[i][j] is True iff i beats j: i.e., j is one of the (n-1)/2 moves preceding i
+    outcomes = tuple(
+        tuple(None if i == j else (i - j) % n <= n // 2 for j in range(n))
+        for i in range(n)
+    )
+
+    # Map every non-empty prefix of every move to that move. Prefixes shared by several moves (e.g., 's' in
+    # rock-paper-scissors-lizard-Spock) are ambiguous, and omitted. Full move names always resolve.
+    prefixes = {}
+    ambiguous = set()
+    for index, move in enumerate(moves):
+        for length in range(1, len(move) + 1):
+            prefix = move[:length]
+            if prefix in prefixes and prefixes[prefix] != index:
+                ambiguous.add(prefix)
+            prefixes[prefix] = index
+
+    for prefix in ambiguous:
+        prefixes.pop(prefix)
+
+    for index, move in enumerate(moves):
+        prefixes[move] = index
+
+    return GameVariant(name, description, tuple(moves), outcomes, prefixes)
+
+
+DEFAULT_VARIANT = 'rps'
+
+# Built once, at import (i.e., Lambda cold start), so resolving a throw is a pair of dict/tuple lookups
+VARIANTS = {variant.name: variant for variant in [
+    buildVariant('rps', 'rock-paper-scissors',
+                 ('rock', 'paper', 'scissors')),
+    buildVariant('rpsls', 'rock-paper-scissors-lizard-Spock',
+                 ('rock', 'spock', 'paper', 'lizard', 'scissors')),
+    buildVariant('rps7', 'RPS-7',
+                 ('water', 'air', 'paper', 'sponge', 'scissors', 'fire', 'rock')),
+    buildVariant('rps15', 'RPS-15',
+                 ('gun', 'lightning', 'devil', 'dragon', 'water', 'air', 'paper', 'sponge', 'wolf', 'tree', 'human',
+                  'snake', 'scissors', 'fire', 'rock')),
+]}
+
+
+def getVariant(name):
+    """
+    Get a game variant by name
+    @param name: Variant name (case-insensitive). None selects the default variant
+    @return: Returns GameVariant if found, otherwise None
+    """
+    if name is None:
+        return VARIANTS[DEFAULT_VARIANT]
+
+    return VARIANTS.get(name.lower())
+
+# Every play (prefix) accepted by at least one variant, so a throw that can't resolve under any variant is rejected early
+ANY_VARIANT_PREFIXES = frozenset(prefix for variant in VARIANTS.values() for prefix in variant.prefixes)
+
+
+def isPlayInAnyVariant(play):
+    """
+    Determine if the play resolves to a move in at least one variant
+    @param play: Move name (or any unambiguous substring from the left/start)
+    @return: Returns True if some variant accepts the play, otherwise False
+    """
+    return play.lower() in ANY_VARIANT_PREFIXES